@@ -1,25 +1,212 @@
-# Written by Rune Johannesen, (c)2023
-from logging import Logger, handlers, Formatter, getLogger, INFO
-from os import mkdir, getcwd, chdir
-from os.path import dirname, join, exists, realpath
-import sys
-
-
-CURRENT_DIR: str = getcwd()
-if getattr(sys, 'frozen', False):
-    CURRENT_DIR: str = dirname(sys.executable)
-else: CURRENT_DIR: str = dirname(realpath(__file__))
-chdir(CURRENT_DIR)
-
-def setup_logger(name: str) -> Logger:
-    log_dir: str = "LOG"
-    logging_dir: str = join(CURRENT_DIR, log_dir)
-    if not exists(logging_dir): mkdir(logging_dir)
-    log_full_path: str = join(CURRENT_DIR, log_dir, name+".log")
-    log_format: Formatter = Formatter('%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S')
-    log_handler: handlers.TimedRotatingFileHandler = handlers.TimedRotatingFileHandler(log_full_path, 'midnight', 1, backupCount=180)
-    log_handler.setFormatter(log_format)
-    logger = getLogger(name)
-    logger.setLevel(INFO)
-    logger.addHandler(log_handler)
-    return(logger)
\ No newline at end of file
+# Written by Rune Johannesen, (c)2023
+from logging import Logger, handlers, Formatter, getLogger, INFO, ERROR
+from os import makedirs, listdir, remove, rename
+import os
+from os.path import dirname, join, abspath, basename
+from time import strftime, monotonic
+from queue import SimpleQueue, Empty
+from atexit import register
+import logging
+import sys
+
+
+# The log format only uses asctime and message, so skip collecting the rest on every LogRecord.
+# NOTE: These are process-global logging toggles and also apply to loggers outside this module.
+logging.logProcesses = False
+logging.logThreads = False
+logging.logMultiprocessing = False
+logging._srcfile = None # Disables the findCaller stack walk (filename, lineno and funcName are not recorded).
+
+CURRENT_DIR: str = dirname(sys.executable) if getattr(sys, 'frozen', False) else abspath(dirname(__file__) or '.')
+
+class _FastFormatter(Formatter):
+    """Formatter for the fixed '%(asctime)s %(message)s' format used by setup_logger.
+    asctime is rendered once per second and reused for every record logged within that second."""
+    _last: tuple = (None, "")
+
+    def formatTime(self, record, datefmt: str = None) -> str:
+        second: int = int(record.created)
+        last: tuple = self._last
+        if last[0] == second: return(last[1])
+        asctime: str = strftime(datefmt or self.default_time_format, self.converter(second))
+        self._last = (second, asctime)
+        return(asctime)
+
+    def format(self, record) -> str:
+        if record.exc_info or record.exc_text or record.stack_info: return(super().format(record))
+        return(self.formatTime(record, self.datefmt)+" "+record.getMessage())
+
+class _BufferedRotatingFileHandler(handlers.RotatingFileHandler):
+    """RotatingFileHandler that writes through a 64 KB buffer and keeps track of the file size itself.
+    The stream is only flushed when the buffer is full, on ERROR and above, by the listener every 30 seconds, on rollover and on close."""
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=65536, encoding='utf-8', errors='replace')
+        self._size: int = stream.tell()
+        return(stream)
+
+    def emit(self, record) -> None:
+        try:
+            msg: str = self.format(record) + self.terminator
+            if self.stream is None: self.stream = self._open()
+            if self.maxBytes > 0 and self._size + len(msg) >= self.maxBytes: self.doRollover()
+            self.stream.write(msg)
+            self._size += len(msg)
+            if record.levelno >= ERROR: self.flush()
+        except RecursionError: raise
+        except Exception: self.handleError(record)
+
+    def doRollover(self) -> None:
+        """Rotates like RotatingFileHandler.doRollover, but finds the existing backups with one listdir instead of checking every name up to backupCount."""
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if self.backupCount > 0:
+            prefix: str = basename(self.baseFilename)+"."
+            backups: list = sorted((int(f[len(prefix):]) for f in listdir(dirname(self.baseFilename)) if f.startswith(prefix) and f[len(prefix):].isdigit()), reverse=True)
+            for index in backups:
+                if index >= self.backupCount: remove(f"{self.baseFilename}.{index}")
+                else: rename(f"{self.baseFilename}.{index}", f"{self.baseFilename}.{index+1}")
+            self.rotate(self.baseFilename, f"{self.baseFilename}.1")
+        if not self.delay: self.stream = self._open()
+
+_LOG_FORMAT: Formatter = _FastFormatter('%(asctime)s %(message)s', datefmt='%Y-%m-%d %H:%M:%S') # Shared by every handler set up here.
+_LOGGERS: dict = {} # Loggers already set up in this process, keyed by name.
+
+_FLUSH_INTERVAL: float = 30.0 # Seconds a record can wait in the buffers before it is written to the file.
+
+class _LogListener(handlers.QueueListener):
+    """One background thread that writes the records of every logger set up here, each to the handler registered for its logger name.
+    Buffered records are flushed to the files at least every _FLUSH_INTERVAL seconds, also when no new records arrive."""
+    def __init__(self, queue: SimpleQueue) -> None:
+        super().__init__(queue)
+        self.targets: dict = {}
+        self.files: dict = {} # The file handler behind each target, keyed by logger name. MemoryHandler.close() drops its own reference to it.
+        self.pending: float = 0.0 # monotonic time of the oldest record that is not flushed yet, 0.0 if there is none.
+
+    def handle(self, record) -> None:
+        target = self.targets.get(record.name)
+        if target and record.levelno >= target.level:
+            target.handle(record)
+            if not self.pending: self.pending: float = monotonic()
+        if self.pending and monotonic() - self.pending >= _FLUSH_INTERVAL: self.flush()
+
+    def dequeue(self, block: bool):
+        """Waits for the next record, flushes the buffers meanwhile when the oldest buffered record is _FLUSH_INTERVAL seconds old."""
+        while True:
+            timeout: float = max(0.0, _FLUSH_INTERVAL - (monotonic() - self.pending)) if self.pending else None
+            try: return(self.queue.get(block, timeout))
+            except Empty:
+                if not block: raise
+                self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered records of every target to its file"""
+        self.pending: float = 0.0
+        for target in self.targets.values():
+            target.flush()
+            if target.target: target.target.flush()
+
+    def close(self) -> None:
+        """Stops the thread after the queued records are written, then flushes and closes every target and its file"""
+        if self._thread is not None: self.stop()
+        for name, target in self.targets.items():
+            target.close()
+            self.files[name].close()
+
+class _NoLock():
+    """Stand-in for Handler.lock on handlers that are only used from the listener thread."""
+    def acquire(self) -> None: pass
+    def release(self) -> None: pass
+    def __enter__(self) -> None: pass
+    def __exit__(self, *exc) -> None: pass
+    def _at_fork_reinit(self) -> None: pass # Called on every handler lock by logging after os.fork().
+
+_LOG_QUEUE: SimpleQueue = SimpleQueue()
+_LISTENER: _LogListener = _LogListener(_LOG_QUEUE)
+
+def _close_listener() -> None:
+    """atexit hook that closes the listener of this process. A forked child closes its own listener, not the one of the parent."""
+    _LISTENER.close()
+
+def _discard_stream(file_handler: handlers.RotatingFileHandler) -> None:
+    """Closes the stream a forked child inherited from the parent without writing its buffer to the file, the parent writes that data itself."""
+    stream = file_handler.stream
+    if stream is None: return
+    null_fd: int = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(null_fd, stream.fileno()) # Only replaces the file descriptor of the child.
+    os.close(null_fd)
+    stream.close()
+    file_handler.stream = None # Opened again by the first record the child writes.
+
+def _close_at_process_exit(listener: _LogListener) -> None:
+    """multiprocessing after-fork hook. Processes started by multiprocessing end with os._exit, which skips atexit, so a multiprocessing finalizer closes the listener instead."""
+    from multiprocessing.util import Finalize
+    Finalize(listener, listener.close, exitpriority=0)
+
+def _after_fork_in_child() -> None:
+    """Gives a forked child its own queue and listener thread. The child inherits the queue, but not the thread that writes the queued records.
+    Records the parent had buffered but not written yet are dropped in the child, so they are not written twice."""
+    global _LOG_QUEUE, _LISTENER
+    parent: _LogListener = _LISTENER
+    _LOG_QUEUE = SimpleQueue()
+    _LISTENER = _LogListener(_LOG_QUEUE)
+    _LISTENER.targets, _LISTENER.files = parent.targets, parent.files
+    for name, target in _LISTENER.targets.items():
+        target.buffer.clear()
+        _discard_stream(_LISTENER.files[name])
+    for logger in _LOGGERS.values():
+        for handler in logger.handlers:
+            if isinstance(handler, handlers.QueueHandler): handler.queue = _LOG_QUEUE
+    if _LISTENER.targets: _LISTENER.start()
+    mp_util = sys.modules.get("multiprocessing.util")
+    # Runs after multiprocessing has cleared the finalizers it inherited from the parent.
+    if mp_util: mp_util.register_after_fork(_LISTENER, _close_at_process_exit)
+
+if hasattr(os, "register_at_fork"): os.register_at_fork(after_in_child=_after_fork_in_child)
+
+LOG_DIR: str = join(CURRENT_DIR, "LOG")
+makedirs(LOG_DIR, exist_ok=True)
+
+def _warn_eager_format(logger: Logger) -> None:
+    """Writes a one-time warning to stderr the first time logger gets a message that looks formatted before the call (f-string or str.format)."""
+    make_record = logger.makeRecord
+    def makeRecord(name, level, fn, lno, msg, args, exc_info, func=None, extra=None, sinfo=None):
+        if not args and isinstance(msg, str) and '{' in msg and '%' not in msg:
+            sys.stderr.write(f"General_logger: logger '{logger.name}' received a pre-formatted message, use %-style arguments instead: logger.info(\"msg %s\", arg)\n")
+            logger.makeRecord = make_record
+        return(make_record(name, level, fn, lno, msg, args, exc_info, func, extra, sinfo))
+    logger.makeRecord = makeRecord
+
+def setup_logger(name: str, single_writer: bool = True) -> Logger:
+    """Returns the logger for name. Repeated calls with the same name return the same logger without adding another handler.
+    The logger does not propagate to the root logger. Avoid changing its level at runtime, since that clears the isEnabledFor cache.
+    Log with %-style arguments, example: logger.info("Client Error: %s -> URL: %s", error, url) or logger.log(level, fmt, *args). The message is then only formatted when the level is enabled. It is formatted on the calling thread when the record is queued, the listener thread only writes it.
+    :single_writer: boolean (Optional) The buffer and file handlers are only written to by the shared listener thread, so they run without a lock. Set to False to keep the handler locks. Default is True"""
+    if name in _LOGGERS: return(_LOGGERS[name])
+    logger = getLogger(name)
+    if any(isinstance(h, handlers.QueueHandler) and h.queue is _LOG_QUEUE for h in logger.handlers):
+        _LOGGERS[name] = logger
+        return(logger)
+    log_full_path: str = join(LOG_DIR, name+".log")
+    log_handler: handlers.RotatingFileHandler = _BufferedRotatingFileHandler(log_full_path, maxBytes=50*1024*1024, backupCount=180)
+    log_handler.setFormatter(_LOG_FORMAT)
+    # Records are buffered and written in batches. ERROR and above, a full buffer, the listener every 30 seconds or interpreter shutdown flushes the buffer.
+    buffered_handler: handlers.MemoryHandler = handlers.MemoryHandler(capacity=1024, flushLevel=ERROR, target=log_handler, flushOnClose=True)
+    if single_writer:
+        for handler in (log_handler, buffered_handler): handler.lock = _NoLock()
+    # The logger only enqueues records, the file is written from the shared listener thread.
+    _LISTENER.targets[name] = buffered_handler
+    _LISTENER.files[name] = log_handler
+    if _LISTENER._thread is None or not _LISTENER._thread.is_alive():
+        _LISTENER._thread = None
+        _LISTENER.start()
+        register(_close_listener) # Runs before logging.shutdown, which is registered when logging is imported.
+    logger.setLevel(INFO)
+    logger.propagate = False
+    _warn_eager_format(logger)
+    queue_handler: handlers.QueueHandler = handlers.QueueHandler(_LOG_QUEUE)
+    # No filters are installed and SimpleQueue is thread safe, so skip Handler.handle's filter loop and lock.
+    queue_handler.handle = queue_handler.emit
+    logger.addHandler(queue_handler)
+    _LOGGERS[name] = logger
+    return(logger)
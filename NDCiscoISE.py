@@ -2,14 +2,51 @@
 # Developed using the official Cisco ISE API documentation:
 # https://developer.cisco.com/docs/identity-services-engine/latest
 from os.path import splitext, basename
-from re import search
+from re import compile as re_compile, IGNORECASE
+from asyncio import sleep, Lock
+from time import time
+from xml.sax.saxutils import escape
+from base64 import b64encode
 from General_logger import setup_logger
 from typing import Union
-from Req import Req
+from urllib.parse import parse_qsl, urlencode
+from itertools import islice
+from functools import lru_cache
+from Req import Req, TokenBucket, LRUCache
+
+
+_SCRIPTNAME: str = splitext(basename(__file__))[0] # Logger name. The logger is set up the first time something is logged, setup_logger returns the same logger after that.
+# ERS api subtrees that support bulk requests -> (XML namespace, resource media type version)
+_BULK_RESOURCES: dict = {"networkdevice": ("network","1.1"), "endpoint": ("identity","1.0"), "sgt": ("trustsec","1.0"), "sgacl": ("trustsec","1.0"), "egressmatrixcell": ("trustsec","1.0"), "sgmapping": ("trustsec","1.0"), "sgmappinggroup": ("trustsec","1.0"), "sgtvnvlan": ("trustsec","1.0"), "sxpconnections": ("sxp","1.0"), "sxplocalbindings": ("sxp","1.0"), "ancendpoint": ("anc","1.0")}
+_BULK_MAX_IDS: int = 5000 # Maximum number of ids in one bulk request.
+_CONTAINS_RE = re_compile(r"contains", IGNORECASE) # Acibindings only support the CONTAINS filter mode.
+_OPENAPI_METHODS: frozenset = frozenset({"GET","POST","PUT","DELETE"})
+_OPENAPI_UPDATE_METHODS: frozenset = frozenset({"POST","PUT"}) # Methods that need payloads.
+_MSG_API: str = "{caller}: You must provide the api/subtree {purpose}, example: networkdevice, endpoint, networkdevicegroup, etc."
+_MSG_LIST: str = "{caller}: Parameter {argname} must be a non-empty list of {description}. Example: {example}"
+_MSG_PAIRS: str = "{caller}: Every entry in {argname} must be a list of two, the {key} and the payload. Example: {example}"
+_MSG_OPENAPI_METHOD: str = "ISE_OpenAPI: You must provide a valid method to use for OpenAPI, valid values are: GET, POST, PUT, DELETE"
+# Examples used in the error messages of list parameters, keyed by parameter name.
+_EXAMPLES: dict = {"names": "[\"ISE_EST_Local_Host\", \"Device2\", etc.]", "ids": "[\"object id\", \"object id\", etc]", "namesandpayload": "[[\"ISE_EST_Local_Host\", {\"object\": \"payload\"}], [\"Device2\", {\"object\": \"payload\"}], etc.]", "idsandpayload": "[[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]", "objects": "[{\"object1\":\"payload\"}, {\"object2\":\"payload\"}, etc.]", "endpointpayloads": "[{\"endpoint1\": \"payload\"}, {\"endpoint2\": \"payload\"}, etc.]"}
+
+@lru_cache(maxsize=128)
+def _norm_api(api: str) -> str: return(api.lower()) # Bulk and versioninfo calls repeat the same few subtrees, for instance every bulk status poll.
+
+
+class ISEArgumentError(ValueError):
+    """Raised when a required argument is missing or has the wrong format."""
+    __slots__ = ()
+
+
+class ISERequestError(RuntimeError):
+    """Raised when a request still fails after its retries and the result would be incomplete without it."""
+    __slots__ = ()
 
 
 class NDCiscoISE():
-    def __init__(self, username: str, password: str, ise_ip_address: str, headers: str = None, timeout: int = None, rate_limit: int = 30, use_ssl: bool = True) -> None:
+    __slots__ = ("__auth", "__ip", "__headers", "__timeout", "__rate_limit", "__bucket", "__max_concurrent", "__max_retries", "__use_ssl", "__base_url", "__base_url_openapi", "__maxresults", "__cache", "__versioninfo_locks", "__versioninfo_ttl", "__total_ttl", "__req")
+
+    def __init__(self, username: str, password: str, ise_ip_address: str, headers: dict = None, timeout: int = None, rate_limit: int = 30, use_ssl: bool = True, cache_backend = None, max_concurrent: int = 10, max_retries: int = 5, cache_size: int = 256) -> None:
         """Cisco ISE help module.\n
         :username: (Required) Username to use with Cisco ISE API requests\n
         :password: (Required) Password to use with Cisco ISE API requests\n
@@ -17,38 +54,155 @@ class NDCiscoISE():
         :headers: (Optional) Custom headers to use with Cisco ISE API requests\n
         :timeout: (Optional) Request timeout in seconds for each request. Default is 30 seconds.\n
         :rate_limit: (Optional) Requests per second as integer. Default is 30 requests per second as defined by the Cisco ISE official documentation. https://developer.cisco.com/docs/identity-services-engine/latest/#!rate-limits
-            Setting this value lower than 30 could help negate 500: Server Error on many requests."""
-        self.__scriptname: str = splitext(basename(__file__))[0]
-        self.__logger = setup_logger(self.__scriptname)
-        self.__usr: str = username
-        self.__psw: str = password
+            Setting this value lower than 30 could help negate 500: Server Error on many requests.\n
+        :cache_backend: (Optional) Dict-like object to keep cached GET responses (ETag) and versioninfo results in, for instance a shelve.Shelf to keep the cache across restarts. Keys are strings. Default is an in-memory LRUCache of cache_size entries.\n
+        :max_concurrent: (Optional) Maximum number of requests in flight against Cisco ISE at the same time, the rate limit still sets the pace. Default is 10.\n
+        :max_retries: (Optional) Times a request is retried with exponential backoff when Cisco ISE answers (408), (429) Too many requests, (500), (502), (503) or (504). Default is 5.\n
+        :cache_size: (Optional) Maximum number of entries in the default in-memory cache, the least recently used entry is dropped first. Not used with cache_backend. Default is 256."""
         self.__ip: str = ise_ip_address
-        self.__headers: str = headers
+        self.__headers: dict = headers
         self.__timeout: int = timeout
         self.__rate_limit: int = rate_limit
+        self.__bucket: TokenBucket = TokenBucket(rate_limit) # Shared by every Req of this instance, so back to back calls stay within the rate limit.
+        self.__max_concurrent: int = max_concurrent
+        self.__max_retries: int = max_retries
         self.__use_ssl: bool = use_ssl
-        for index, check in enumerate([self.__usr, self.__psw, self.__ip]):
-            if not check:
-                if index == 0: raise Exception("Username cannot be empty, you must enter a username.")
-                if index == 1: raise Exception("Password cannot be empty, you must enter a password.")
-                if index == 2: raise Exception("Cisco ISE IP address cannot be empty, you must enter an IP address.")
+        if not username: raise ISEArgumentError("Username cannot be empty, you must enter a username.")
+        if not password: raise ISEArgumentError("Password cannot be empty, you must enter a password.")
+        if not ise_ip_address: raise ISEArgumentError("Cisco ISE IP address cannot be empty, you must enter an IP address.")
+        # The Basic Authorization header is encoded once here and sent with every request, the password itself is not kept.
+        self.__auth: str = "Basic "+b64encode(f"{username}:{password}".encode("utf-8")).decode()
         self.__base_url: str = f"https://{self.__ip}:9060/ers/"
         self.__base_url_openapi: str = f"https://{self.__ip}"
         self.__maxresults: int = 100 # Maximum results to return per API call when using ISE_GET_api method.
-
-    def __returnNearestHundreds(self, integer: int) -> int:
-        """Returns an integer rounded up to the nearest hundreds\n
-        Examples:
-            99 -> 100\n
-            101 -> 200"""
-        return(int((-(-int(integer) // 100))*100))
-
-    async def __execute(self, __job: list) -> list:
-        """Private method that will execute requests."""
-        __nd = Req(self.__headers, self.__timeout, self.__rate_limit, self.__use_ssl, f"{self.__usr} , {self.__psw}")
-        __result: list = await __nd.make_requests(__job)
+        # GET responses with an ETag, keyed by url -> (etag, response body)
+        # ISE_GET_versioninfo results, keyed by "versioninfo:<api>" -> (timestamp, versioninfo)
+        # ISE_GET_api object totals, keyed by "<first page url>#total" -> (timestamp, total)
+        self.__cache = cache_backend if cache_backend is not None else LRUCache(cache_size)
+        self.__versioninfo_locks: dict = {}
+        self.__versioninfo_ttl: int = 300 # Seconds a versioninfo result is reused before it is requested again.
+        self.__total_ttl: int = 5 # Seconds the object total found by ISE_GET_api is reused before the first page is requested again.
+        self.__req: Req = None # Shared Req with an open connection pool, only set between open() and close().
+
+    async def __aenter__(self):
+        """Opens one connection pool that every request made inside the async with block reuses."""
+        await self.open()
+        return(self)
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        """Opens one connection pool that every following request reuses, until close() is called. Same as entering async with NDCiscoISE(...)."""
+        if self.__req is None: self.__req: Req = self.__new_req(keep_alive=True)
+
+    async def close(self) -> None:
+        """Closes the connection pool opened by open() or async with. Does nothing if there is none."""
+        if self.__req is not None:
+            await self.__req.close()
+            self.__req: Req = None
+
+    async def __execute_chunked(self, __job, chunk: int = None, ordered: bool = False):
+        """Private async generator that executes requests in windows of chunk requests and yields the results of each window.
+        __job can be any iterable of requests, for instance a generator, only one window is built at a time.
+        Default window size is the rate limit or 100, whichever is larger. Callers that stop iterating early do not send the remaining windows."""
+        chunk: int = chunk or max(self.__rate_limit, 100)
+        __job = iter(__job)
+        while True:
+            __window: list = list(islice(__job, chunk))
+            if not __window: return
+            yield(await self.__execute(__window, ordered))
+
+    def __require_api(self, api: str, caller: str, purpose: str) -> None:
+        """Raises ISEArgumentError if api is empty. purpose completes the message, for instance: to get data from"""
+        if not api:
+            raise ISEArgumentError(_MSG_API.format(caller=caller, purpose=purpose))
+
+    def __require_list(self, value: list, caller: str, argname: str, description: str) -> None:
+        """Raises ISEArgumentError if value is not a list or is empty. description completes the message, for instance: object ids to be deleted"""
+        if not isinstance(value, list) or not value:
+            raise ISEArgumentError(_MSG_LIST.format(caller=caller, argname=argname, description=description, example=_EXAMPLES[argname]))
+
+    def __require_pairs(self, value: list, caller: str, argname: str, description: str) -> None:
+        """Raises ISEArgumentError if value is not a non-empty list of [name or id (string), payload] entries."""
+        self.__require_list(value, caller, argname, description)
+        if any(not (isinstance(r, (list,tuple)) and len(r) == 2 and isinstance(r[0], str)) for r in value):
+            raise ISEArgumentError(_MSG_PAIRS.format(caller=caller, argname=argname, key="name" if argname == "namesandpayload" else "id", example=_EXAMPLES[argname]))
+
+    async def __run_items(self, method: str, api: str, items: list, caller: str, argname: str, description: str, purpose: str, by_name: bool = False, with_payload: bool = False) -> list:
+        """Private method that validates api and items and sends one request per item to config/<api>/<id> or config/<api>/name/<name>, returns the results.
+        by_name sends the requests to config/<api>/name/<name>. with_payload takes items as [name or id, payload] pairs, otherwise items are names or ids.
+        argname and description are only used in the error messages."""
+        self.__require_api(api, caller, purpose)
+        url: str = f"{self.__base_url}config/{api}/name/" if by_name else f"{self.__base_url}config/{api}/"
+        # Repeated names or ids are only requested once (the last payload wins), every position in items still gets its result.
+        if with_payload:
+            self.__require_pairs(items, caller, argname, description)
+            payloads: dict = dict(items)
+            keys: list = [n for n, _ in items]
+            MultiTask: list = [(method, url+n, p) for n, p in payloads.items()]
+        else:
+            self.__require_list(items, caller, argname, description)
+            keys: list = items
+            MultiTask: list = [(method, url+i) for i in dict.fromkeys(items)]
+        results: list = await self.__execute(MultiTask)
+        if len(MultiTask) == len(keys): return(results)
+        by_key: dict = dict(zip(dict.fromkeys(keys), results))
+        return([by_key[k] for k in keys])
+
+    @staticmethod
+    def __paging(api: str) -> tuple:
+        """Returns the page and size query parameters of the api path as (page, size) integers, None for each one that is missing."""
+        params: dict = {k: v for k, v in parse_qsl(api.partition("?")[2]) if k in ("page","size") and v.isdigit()}
+        return((int(params["page"]) if "page" in params else None, int(params["size"]) if "size" in params else None))
+
+    @staticmethod
+    def __with_paging(api: str, page: int, size: int = None) -> str:
+        """Returns the api path with its page query parameter set to page, and size as well when provided. Other query parameters are kept as they are."""
+        path, _, query = api.partition("?")
+        params: list = [(k, v) for k, v in parse_qsl(query, keep_blank_values=True) if k != "page" and not (size and k == "size")]
+        params.append(("page", page))
+        if size: params.append(("size", size))
+        return(f"{path}?{urlencode(params, safe=':,')}")
+
+    @staticmethod
+    def __page_count(total: int, size: int) -> int:
+        """Returns the number of pages of size objects needed to hold total objects."""
+        return((total + size - 1) // size)
+
+    @staticmethod
+    def __filter_qs(filter: str) -> str:
+        """Returns the filter as a query string parameter, prefixed with filter= if it is missing. Returns an empty string if there is no filter."""
+        if not filter: return("")
+        return(filter if filter.startswith("filter=") else f"filter={filter}")
+
+    def __invalidate(self, url: str) -> None:
+        """Removes cached GET responses that a create, update or delete request on url can make stale.
+        ERS requests drop the cached responses of the same config/* subtree, any other request drops every cached response."""
+        prefix: str = self.__base_url_openapi
+        if url.startswith(self.__base_url):
+            prefix: str = self.__base_url+"/".join(url[len(self.__base_url):].split("?",1)[0].split("/")[:2])
+        for cached_url in [u for u in self.__cache if u.startswith(prefix)]:
+            del self.__cache[cached_url]
+
+    def __new_req(self, keep_alive: bool = False) -> Req:
+        """Private method that returns a Req set up with the settings of this instance."""
+        return(Req(self.__headers, self.__timeout, self.__rate_limit, self.__use_ssl, etag_cache=self.__cache, auth_header=self.__auth, keep_alive=keep_alive, max_concurrent=self.__max_concurrent, max_retries=self.__max_retries, bucket=self.__bucket))
+
+    async def __execute(self, __job: list, ordered: bool = False) -> list:
+        """Private method that will execute requests. With ordered, requests that are not GET are sent one at a time in order."""
+        for __entry in __job:
+            if __entry[0].upper() != "GET": self.__invalidate(__entry[1])
+        __nd: Req = self.__req or self.__new_req()
+        __result: list = await __nd.make_requests(__job, ordered)
         return(__result)
 
+    def __bulk_delete_payload(self, api: str, ids: list) -> str:
+        """Returns the XML payload for a bulk delete request of the ids provided on the api subtree."""
+        namespace, version = _BULK_RESOURCES[api]
+        idlist: str = "".join(f"<id>{escape(i)}</id>" for i in ids)
+        return(f'<?xml version="1.0" encoding="UTF-8" standalone="yes"?><ns4:{api}BulkRequest operationType="delete" resourceMediaType="vnd.com.cisco.ise.{namespace}.{api}.{version}+xml" xmlns:ns4="{namespace}.ers.ise.cisco.com"><idList>{idlist}</idList></ns4:{api}BulkRequest>')
+
     ################################################
     # Cisco ISE OpenAPI -> *                       #
     #                                              #
@@ -57,60 +211,63 @@ class NDCiscoISE():
     # that uses OpenAPI.                           #
     ################################################
 
-    async def ISE_OpenAPI(self, method: str, api: str, payloads: list=[]) -> list:
+    async def ISE_OpenAPI(self, method: str, api: str, payloads: list = None) -> list:
         """This function will help utilizing the OpenAPI on the Cisco ISE management nodes.
         :method: string (Required) -> The method to use on the OpenAPI, valid values are: GET, POST, PUT, DELETE
         :api: string (Required) -> The OpenAPI to access, example: /api/v1/policy/network-access/policy-set
         :payloads: list (Optional) -> The payloads to use with methods: POST & PUT. This is required with POST & PUT. Example: [{{\"object1\":\"payload\"}}, {{\"object2\":\"payload\"}}, etc.]
             More help: https://<your ISE IP address>/api/swagger-ui - You must login as Super Admin.
         NOTE: You can add filtering, sorting and/or paging for specific Open APIs like this:
-            /api/v1/endpoint?page=1&size=100&sort=asc&filter=mac.CONTAINS.B8 (Maximum size is 100 on Cisco ISE)"""
-        valid_update_methods: dict = {"POST","PUT"}
-        page = None
-        size = None
+            /api/v1/endpoint?page=1&size=100&sort=asc&filter=mac.CONTAINS.B8 (Maximum size is 100 on Cisco ISE)
+        Raises ISERequestError if one of the remaining pages of a GET cannot be retrieved, instead of returning a result with a page missing."""
         if not method:
-            raise Exception("ISE_OpenAPI: You must provide the method to use for OpenAPI, valid values are: GET, POST, PUT, DELETE")
-        if method.upper() not in {"GET","POST","PUT","DELETE"}:
-            raise Exception("ISE_OpenAPI: You must provide a valid method to use for OpenAPI, valid values are: GET, POST, PUT, DELETE")
+            raise ISEArgumentError(_MSG_OPENAPI_METHOD)
+        method: str = method.upper()
+        if method not in _OPENAPI_METHODS:
+            raise ISEArgumentError(_MSG_OPENAPI_METHOD)
         if not api:
-            raise Exception("ISE_OpenAPI: You must provide the api to get data from, for instance: /api/v1/policy/network-access/policy-set")
-        if method.upper() in valid_update_methods and not payloads:
-            raise Exception(f"ISE_OpenAPI: You must provide the payload(s) when using the method {method.upper()} -> payloads example: [{{\"object1\":\"payload\"}}, {{\"object2\":\"payload\"}}, etc.]")
+            raise ISEArgumentError("ISE_OpenAPI: You must provide the api to get data from, for instance: /api/v1/policy/network-access/policy-set")
+        if method in _OPENAPI_UPDATE_METHODS and not payloads:
+            raise ISEArgumentError(f"ISE_OpenAPI: You must provide the payload(s) when using the method {method} -> payloads example: [{{\"object1\":\"payload\"}}, {{\"object2\":\"payload\"}}, etc.]")
         if not api.startswith("/"): api: str = f"/{api}"
-        if "page=" in api:
-            page: int = int(search(r"page=(\d+)",api).group(1))
-        if "size=" in api:
-            size: int = int(search(r"size=(\d+)",api).group(1))
         returnResults: list = []
         url: str = f"{self.__base_url_openapi}{api}"
-        if method.upper() in valid_update_methods and payloads:
-            MultiTask: list = [[method, url, p] for p in payloads]
-            results: list = await self.__execute(MultiTask)
-        else:
-            results: list = await self.__execute([[method, url]])
-        if results and results[0]:
+        # Pages are requested one after another until the response shows there are no more, instead of calling ISE_OpenAPI again for every page.
+        while url:
+            page, size = self.__paging(api)
+            if method in _OPENAPI_UPDATE_METHODS and payloads:
+                results: list = await self.__execute([(method, url, p) for p in payloads], ordered=True)
+            else:
+                results: list = await self.__execute([[method, url]])
+            url: str = None
+            if not results or not results[0]: break
             if 'nextPage' in results[0]:
-                for result in results[0]['response']:
-                    returnResults.append(result)
-                paged_results: list = await self.ISE_OpenAPI(method=method,api=results[0]['nextPage'].replace(self.__base_url_openapi,""),payloads=payloads)
-                for result in paged_results:
-                    returnResults.append(result)
-            elif isinstance(results,list) and isinstance(results[0],list):
-                for result in results[0]:
-                    returnResults.append(result)
+                returnResults.extend(results[0]['response'])
+                api: str = results[0]['nextPage'].replace(self.__base_url_openapi,"")
+                if not api.startswith("/"): api: str = f"/{api}"
+                url: str = f"{self.__base_url_openapi}{api}"
+                total: int = results[0].get('total')
+                next_page: int = self.__paging(api)[0]
+                if method == "GET" and isinstance(total, int) and results[0]['response'] and next_page:
+                    # The total is known, so the remaining pages are requested together instead of following nextPage one page at a time.
+                    last_page: int = self.__page_count(total, len(results[0]['response']))
+                    MultiTask: list = [("GET", f"{self.__base_url_openapi}{self.__with_paging(api, p)}") for p in range(next_page, last_page+1)]
+                    if MultiTask:
+                        for p, result in enumerate(await self.__execute(MultiTask), next_page):
+                            if not result or 'response' not in result:
+                                raise ISERequestError(f"ISE_OpenAPI: Page {p} of {last_page} of {api.partition('?')[0]} could not be retrieved, the result would be incomplete.")
+                            returnResults.extend(result['response'])
+                    break
+            elif isinstance(results[0],list):
+                returnResults.extend(results[0])
                 if not page and not size:
                     page: int = 1
                     size: int = len(results[0])
-                    api: str = f"{api}?page={page}&size={size}"
                 if page and (len(results[0])==size or len(results[0])==20):
-                    paged_results: list = await self.ISE_OpenAPI(method=method,api=api.replace(f"page={page}",f"page={page+1}"),payloads=payloads)
-                    for result in paged_results:
-                        returnResults.append(result)
-                    page += 1
-            else:
-                if 'response' in results[0] and results[0]['response']:
-                    for result in results[0]['response']:
-                        returnResults.append(result)
+                    api: str = self.__with_paging(api, page+1, size)
+                    url: str = f"{self.__base_url_openapi}{api}"
+            elif 'response' in results[0] and results[0]['response']:
+                returnResults.extend(results[0]['response'])
         return(returnResults)
 
     ################################################
@@ -128,19 +285,13 @@ class NDCiscoISE():
 
         filter example: learnedFrom.CONTAINS.ISE
         """
-        returnResults: list = []
         url: str = f"{self.__base_url}config/acibindings/getall"
         if filter:
-            if "contains" in filter.lower():
-                if not filter.startswith("filter="):
-                    filter: str = f"filter={filter}"
-                url: str = f"{self.__base_url}config/acibindings/getall?{filter}"
-            else: self.__logger.info(f"{self.__scriptname} <> ISE_GET_all_acibindings: Ignored filter. Acibindings only support the 'CONTAINS' filter mode.")
+            if _CONTAINS_RE.search(filter):
+                url: str = f"{url}?{self.__filter_qs(filter)}"
+            else: setup_logger(_SCRIPTNAME).info("%s <> ISE_GET_all_acibindings: Ignored filter. Acibindings only support the 'CONTAINS' filter mode.", _SCRIPTNAME)
         results: list = await self.__execute([["GET", url]])
-        if results and results[0]:
-            for result in results[0]['ArrayList']:
-                returnResults.append(result)
-        return(returnResults)
+        return(results[0]['ArrayList'] if results and results[0] else [])
 
     async def ISE_PUT_release_rejected_endpoints(self, ids: list) -> list:
         """This API allows the client to release a rejected endpoint.
@@ -149,15 +300,12 @@ class NDCiscoISE():
 
         ids example: [\"endpointId\", \"endpointId\", etc.]
         """
-        verification: bool = True
+        self.__require_list(ids, "ISE_PUT_release_rejected_endpoints", "ids", "endpoint ids to release")
         url: str = f"{self.__base_url}config/endpoint/"
-        MultiTask: list = [["PUT", url+i+"/releaserejectedendpoint"] for i in ids]
-        results: list = await self.__execute(MultiTask)
-        for result in results:
-            if not result:
-                verification: bool = False
-                break
-        return(verification) # Returns True if all requests were successful, otherwise False.
+        MultiTask = (("PUT", f"{url}{i}/releaserejectedendpoint") for i in ids)
+        async for results in self.__execute_chunked(MultiTask):
+            if not all(results): return(False)
+        return(True) # Returns True if all requests were successful, otherwise False.
 
     async def ISE_PUT_deregister_endpoints(self, ids: list) -> list:
         """This API allows the client to de-register an endpoint.
@@ -166,25 +314,18 @@ class NDCiscoISE():
 
         ids example: [\"endpointId\", \"endpointId\", etc.]
         """
-        verification: bool = True
+        self.__require_list(ids, "ISE_PUT_deregister_endpoints", "ids", "endpoint ids to de-register")
         url: str = f"{self.__base_url}config/endpoint/"
-        MultiTask: list = [["PUT", url+i+"/deregister"] for i in ids]
-        results: list = await self.__execute(MultiTask)
-        for result in results:
-            if not result:
-                verification: bool = False
-                break
-        return(verification) # Returns True if all requests were successful, otherwise False.
+        MultiTask = (("PUT", f"{url}{i}/deregister") for i in ids)
+        async for results in self.__execute_chunked(MultiTask):
+            if not all(results): return(False)
+        return(True) # Returns True if all requests were successful, otherwise False.
 
     async def ISE_GET_rejected_endpoints(self) -> list:
         """This API allows the client to get the rejected endpoints."""
-        returnResults: list = []
         url: str = f"{self.__base_url}config/endpoint/getrejectedendpoints"
         results: list = await self.__execute([["GET", url]])
-        if results and results[0]:
-            for result in results[0]['OperationResult']['resultValue']:
-                returnResults.append(result)
-        return(returnResults) # Example: [{'value': '2', 'name': 'Rejected EndPoint Count'}, {'value': '68:3B:78:D9:3C:00', 'name': 'EndPoint'}]
+        return(results[0]['OperationResult']['resultValue'] if results and results[0] else []) # Example: [{'value': '2', 'name': 'Rejected EndPoint Count'}, {'value': '68:3B:78:D9:3C:00', 'name': 'EndPoint'}]
 
     async def ISE_PUT_register_endpoints(self, endpointpayloads: list) -> list:
         """This API allows the client to register an endpoint.
@@ -197,15 +338,12 @@ class NDCiscoISE():
 
         See more information here regarding payloads: https://developer.cisco.com/docs/identity-services-engine/latest/#!endpoint
         """
-        verification: bool = True
+        self.__require_list(endpointpayloads, "ISE_PUT_register_endpoints", "endpointpayloads", "endpoint payloads to register")
         url: str = f"{self.__base_url}config/endpoint/register"
-        MultiTask: list = [["PUT", url, i] for i in endpointpayloads]
-        results: list = await self.__execute(MultiTask)
-        for result in results:
-            if not result:
-                verification: bool = False
-                break
-        return(verification) # Returns True if all requests were successful, otherwise False.
+        MultiTask = (("PUT", url, i) for i in endpointpayloads)
+        async for results in self.__execute_chunked(MultiTask):
+            if not all(results): return(False)
+        return(True) # Returns True if all requests were successful, otherwise False.
 
     ################################################
     # Configuration (Day 1) -> *                   #
@@ -236,22 +374,7 @@ class NDCiscoISE():
 
         api examples: networkdevice, endpoint, networkdevicegroup etc.
         """
-        if not api:
-            raise Exception("ISE_GET_api_names: You must provide the api/subtree to delete data from, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not names:
-            raise Exception("ISE_GET_api_names: You must provide a list of object names to be deleted. Example: [\"ISE_EST_Local_Host\", \"Device2\", etc.]")
-        if not isinstance(names, list):
-            raise Exception("ISE_GET_api_names: Parameter names must be a list of object names in format: [\"ISE_EST_Local_Host\", \"Device2\", etc.]")
-        if not len(names) > 0:
-            raise Exception("ISE_GET_api_names: Parameter names cannot be empty, you must provide a list of object names to be deleted. Example: [\"ISE_EST_Local_Host\", \"Device2\", etc.]")
-        returnResults: list = []
-        url: str = f"{self.__base_url}config/{api}/name/"
-        MultiTask: list = [["DELETE", url+i] for i in names]
-        results: list = await self.__execute(MultiTask)
-        if results:
-            for result in results:
-                returnResults.append(result)
-        return(returnResults)
+        return(await self.__run_items("DELETE", api, names, "ISE_DELETE_api_names", "names", "object names to be deleted", "to delete data from", by_name=True))
 
     async def ISE_GET_api_names(self, api: str, names: list) -> list:
         """Returns object details from the api subtree and object names in the names list provided.
@@ -262,22 +385,7 @@ class NDCiscoISE():
 
         api examples: networkdevice, endpoint, networkdevicegroup etc.
         """
-        if not api:
-            raise Exception("ISE_GET_api_names: You must provide the api/subtree to get data from, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not names:
-            raise Exception("ISE_GET_api_names: You must provide a list of object names to be processed. Example: [\"ISE_EST_Local_Host\", \"Device2\", etc.]")
-        if not isinstance(names, list):
-            raise Exception("ISE_GET_api_names: Parameter names must be a list of object names in format: [\"ISE_EST_Local_Host\", \"Device2\", etc.]")
-        if not len(names) > 0:
-            raise Exception("ISE_GET_api_names: Parameter names cannot be empty, you must provide a list of object names to be processed. Example: [\"ISE_EST_Local_Host\", \"Device2\", etc.]")
-        returnResults: list = []
-        url: str = f"{self.__base_url}config/{api}/name/"
-        MultiTask: list = [["GET", url+i] for i in names]
-        results: list = await self.__execute(MultiTask)
-        if results:
-            for result in results:
-                returnResults.append(result)
-        return(returnResults)
+        return(await self.__run_items("GET", api, names, "ISE_GET_api_names", "names", "object names to be processed", "to get data from", by_name=True))
 
     async def ISE_PATCH_api_names(self, api: str, namesandpayload: list) -> list:
         """Updates object details from the api subtree and object names in the names list provided.
@@ -293,26 +401,13 @@ class NDCiscoISE():
             }
         }
 
+        NOTE: A name that is repeated in namesandpayload is only updated once, with its last payload. Earlier payloads for the same name are not sent, every position still gets the result. Merge the changes for one name into a single payload to apply them all.
+
         api: (Required) The API config/* subtree you want to update data to.
 
         api examples: networkdevice, endpoint, networkdevicegroup etc.
         """
-        if not api:
-            raise Exception("ISE_PATCH_api_names: You must provide the api/subtree to update data to, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not namesandpayload:
-            raise Exception("ISE_PATCH_api_names: You must provide a list of object names and payloads to be updated. Example: [[\"ISE_EST_Local_Host\", {\"object\": \"payload\"}], [\"Device2\", {\"object\": \"payload\"}], etc.]")
-        if not isinstance(namesandpayload, list):
-            raise Exception("ISE_PATCH_api_names: Parameter names must be a list of object names and payloads in format: [[\"ISE_EST_Local_Host\", {\"object\": \"payload\"}], [\"Device2\", {\"object\": \"payload\"}], etc.]")
-        if not len(namesandpayload) > 0:
-            raise Exception("ISE_PATCH_api_names: Parameter names cannot be empty, you must provide a list of object names and payloads to be updated. Example: [[\"ISE_EST_Local_Host\", {\"object\": \"payload\"}], [\"Device2\", {\"object\": \"payload\"}], etc.]")
-        returnResults: list = []
-        url: str = f"{self.__base_url}config/{api}/name/"
-        MultiTask: list = [["PATCH", url+i[0], i[1]] for i in namesandpayload]
-        results: list = await self.__execute(MultiTask)
-        if results:
-            for result in results:
-                returnResults.append(result)
-        return(returnResults)
+        return(await self.__run_items("PATCH", api, namesandpayload, "ISE_PATCH_api_names", "namesandpayload", "object names and payloads to be updated", "to update data to", by_name=True, with_payload=True))
 
     async def ISE_PUT_api_names(self, api: str, namesandpayload: list) -> list:
         """Updates object details from the api subtree and object names in the names list provided.
@@ -321,71 +416,44 @@ class NDCiscoISE():
 
         NOTE: Full payload is required to update (PUT) an object. Use patch to update parts of an object.
 
+        NOTE: A name that is repeated in namesandpayload is only updated once, with its last payload. Earlier payloads for the same name are not sent, every position still gets the result.
+
         api: (Required) The API config/* subtree you want to update data to.
 
         api examples: networkdevice, endpoint, networkdevicegroup etc.
         """
-        if not api:
-            raise Exception("ISE_PUT_api_names: You must provide the api/subtree to update data to, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not namesandpayload:
-            raise Exception("ISE_PUT_api_names: You must provide a list of object names and payloads to be updated. Example: [[\"ISE_EST_Local_Host\", {\"object\": \"payload\"}], [\"Device2\", {\"object\": \"payload\"}], etc.]")
-        if not isinstance(namesandpayload, list):
-            raise Exception("ISE_PUT_api_names: Parameter names must be a list of object names and payloads in format: [[\"ISE_EST_Local_Host\", {\"object\": \"payload\"}], [\"Device2\", {\"object\": \"payload\"}], etc.]")
-        if not len(namesandpayload) > 0:
-            raise Exception("ISE_PUT_api_names: Parameter names cannot be empty, you must provide a list of object names and payloads to be updated. Example: [[\"ISE_EST_Local_Host\", {\"object\": \"payload\"}], [\"Device2\", {\"object\": \"payload\"}], etc.]")
-        returnResults: list = []
-        url: str = f"{self.__base_url}config/{api}/name/"
-        MultiTask: list = [["PUT", url+i[0], i[1]] for i in namesandpayload]
-        results: list = await self.__execute(MultiTask)
-        if results:
-            for result in results:
-                returnResults.append(result)
-        return(returnResults)
+        return(await self.__run_items("PUT", api, namesandpayload, "ISE_PUT_api_names", "namesandpayload", "object names and payloads to be updated", "to update data to", by_name=True, with_payload=True))
 
-    async def ISE_DELETE_api_ids(self, api: str, ids: list) -> list:
+    async def ISE_DELETE_api_ids(self, api: str, ids: list, bulk_threshold: int = 100) -> list:
         """Deletes objects from the api subtree and IDs provided in the ids list.
         :ids: list (Required) -> List of object ids to delete, example: [\"object id\", \"object id\", etc]
         :api: string (Required) -> The API config/* subtree you want to delete data from.
-            api examples: networkdevice, endpoint, networkdevicegroup etc."""
-        if not api:
-            raise Exception("ISE_DELETE_api_ids: You must provide the api/subtree to delete data from, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not ids:
-            raise Exception("ISE_DELETE_api_ids: You must provide a list of object ids to be deleted. Example: [\"object id\", \"object id\", etc]")
-        if not isinstance(ids, list):
-            raise Exception("ISE_DELETE_api_ids: Parameter ids must be a list of object ids in format: [\"object id\", \"object id\", etc]")
-        if not len(ids) > 0:
-            raise Exception("ISE_DELETE_api_ids: Parameter ids cannot be empty, you must provide a list of object ids to be deleted. Example: [\"object id\", \"object id\", etc]")
-        verification: bool = True
+            api examples: networkdevice, endpoint, networkdevicegroup etc.
+        :bulk_threshold: integer (Optional) -> When at least this many ids are provided and the api subtree supports bulk requests, the ids are deleted with bulk requests of up to 5000 ids each instead of one request per id. Default is 100
+            Bulk supported api subtrees: networkdevice, endpoint, sgt, sgacl, egressmatrixcell, sgmapping, sgmappinggroup, sgtvnvlan, sxpconnections, sxplocalbindings, ancendpoint"""
+        self.__require_api(api, "ISE_DELETE_api_ids", "to delete data from")
+        self.__require_list(ids, "ISE_DELETE_api_ids", "ids", "object ids to be deleted")
+        ids: list = list(dict.fromkeys(ids)) # A repeated id would fail its second delete.
+        bulk_api: str = _norm_api(api)
+        if bulk_api in _BULK_RESOURCES and len(ids) >= bulk_threshold:
+            for i in range(0, len(ids), _BULK_MAX_IDS):
+                bulkId: str = await self.ISE_PUT_bulk_submit(bulk_api, self.__bulk_delete_payload(bulk_api, ids[i:i + _BULK_MAX_IDS]))
+                if not bulkId or not isinstance(bulkId, str): return(False)
+                status: dict = await self.ISE_GET_bulk_wait(bulk_api, bulkId)
+                if status.get("executionStatus") != "COMPLETED" or status.get("failCount", 1) != 0: return(False)
+            return(True)
         url: str = f"{self.__base_url}config/{api}/"
-        MultiTask: list = [["DELETE", url+i] for i in ids]
-        results: list = await self.__execute(MultiTask)
-        for result in results:
-            if not result:
-                verification: bool = False
-                break
-        return(verification)
+        MultiTask = (("DELETE", url+i) for i in ids)
+        async for results in self.__execute_chunked(MultiTask):
+            if not all(results): return(False)
+        return(True)
 
     async def ISE_GET_api_ids(self, api: str, ids: list) -> list:
         """Returns object details from the api subtree and object ids provided in the ids list.
         :ids: list (Required) -> List of object ids to retrieve, example: [\"object id\", \"object id\", etc]
         :api: string (Required) -> The API config/* subtree you want to get data from.
             api examples: networkdevice, endpoint, networkdevicegroup etc."""
-        if not api:
-            raise Exception("ISE_GET_api_ids: You must provide the api/subtree to get data from, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not ids:
-            raise Exception("ISE_GET_api_ids: You must provide a list of object ids to be processed. Example: [\"object id\", \"object id\", etc]")
-        if not isinstance(ids, list):
-            raise Exception("ISE_GET_api_ids: Parameter ids must be a list of object ids in format: [\"object id\", \"object id\", etc]")
-        if not len(ids) > 0:
-            raise Exception("ISE_GET_api_ids: Parameter ids cannot be empty, you must provide a list of object ids to be processed. Example: [\"object id\", \"object id\", etc]")
-        returnResults: list = []
-        url: str = f"{self.__base_url}config/{api}/"
-        MultiTask: list = [["GET", url+i] for i in ids]
-        results: list = await self.__execute(MultiTask)
-        if results:
-            for result in results:
-                returnResults.append(result)
-        return(returnResults)
+        return(await self.__run_items("GET", api, ids, "ISE_GET_api_ids", "ids", "object ids to be processed", "to get data from"))
 
     async def ISE_PATCH_api_ids(self, api: str, idsandpayload: list) -> list:
         """Updates objects on an api subtree with the payloads provided for each object id.
@@ -398,52 +466,20 @@ class NDCiscoISE():
                     }
                 }
             idsandpayload must be a list of lists with the above payload: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]
+            NOTE: An id that is repeated in idsandpayload is only updated once, with its last payload. Earlier payloads for the same id are not sent, every position still gets the result. Merge the changes for one id into a single payload to apply them all.
         :api: string (Required) -> The API config/* subtree you want to update data to.
             api examples: networkdevice, endpoint, networkdevicegroup etc."""
-        if not api:
-            raise Exception("ISE_PATCH_api_ids: You must provide the api/subtree to update data to, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not idsandpayload:
-            raise Exception("ISE_PATCH_api_ids: You must provide a list of ids and payloads to be processed. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        if not isinstance(idsandpayload, list):
-            raise Exception("ISE_PATCH_api_ids: Parameter idsandpayload must be a list of ids and payloads. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        if not len(idsandpayload) > 0:
-            raise Exception("ISE_PATCH_api_ids: Parameter idsandpayload cannot be empty, you must provide a list of ids and payloads to be processed. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        if not idsandpayload[0]:
-            raise Exception("ISE_PATCH_api_ids: You must provide a list of lists with ids and payloads to be processed. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        returnResults: list = []
-        url: str = f"{self.__base_url}config/{api}/"
-        MultiTask: list = [["PATCH", url+i[0], i[1]] for i in idsandpayload]
-        results: list = await self.__execute(MultiTask)
-        if results:
-            for result in results:
-                returnResults.append(result)
-        return(returnResults)
+        return(await self.__run_items("PATCH", api, idsandpayload, "ISE_PATCH_api_ids", "idsandpayload", "ids and payloads to be processed", "to update data to", with_payload=True))
 
     async def ISE_PUT_api_ids(self, api: str, idsandpayload: list) -> list:
         """Updates objects on an api subtree with the payloads provided for each object id.
         :idsandpayload: lists of list (Required) -> Must be a list of ids and full payload to be processed.
             idsandpayload example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]
             NOTE: Full payload is required to update (PUT) an object. Use patch to update parts of an object.
+            NOTE: An id that is repeated in idsandpayload is only updated once, with its last payload. Earlier payloads for the same id are not sent, every position still gets the result.
         :api: string (Required) -> The API config/* subtree you want to update data to.
             api examples: networkdevice, endpoint, networkdevicegroup etc."""
-        if not api:
-            raise Exception("ISE_PUT_api_ids: You must provide the api/subtree to update data to, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not idsandpayload:
-            raise Exception("ISE_PUT_api_ids: You must provide a list of ids and payloads to be processed. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        if not isinstance(idsandpayload, list):
-            raise Exception("ISE_PUT_api_ids: Parameter idsandpayload must be a list of ids and payloads. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        if not len(idsandpayload) > 0:
-            raise Exception("ISE_PUT_api_ids: Parameter idsandpayload cannot be empty, you must provide a list of ids and payloads to be processed. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        if not idsandpayload[0]:
-            raise Exception("ISE_PUT_api_ids: You must provide a list of lists with ids and payloads to be processed. Example: [[\"objectId\", {\"object1\":\"payload\"}], [\"objectId\", {\"object2\":\"payload\"}], etc.]")
-        returnResults: list = []
-        url: str = f"{self.__base_url}config/{api}/"
-        MultiTask: list = [["PUT", url+i[0], i[1]] for i in idsandpayload]
-        results: list = await self.__execute(MultiTask)
-        if results:
-            for result in results:
-                returnResults.append(result)
-        return(returnResults)
+        return(await self.__run_items("PUT", api, idsandpayload, "ISE_PUT_api_ids", "idsandpayload", "ids and payloads to be processed", "to update data to", with_payload=True))
 
     async def ISE_GET_api(self, api: str, filter: str = "", sort: str = "") -> list:
         """Get all objects from the api subtree provided. This function will automatically check how many total objects are available and run through all pages to get all data
@@ -452,39 +488,56 @@ class NDCiscoISE():
         :filter: string (Optional) -> You can add optional filters when retrieving data. See more information on Cisco ISE documentation: https://developer.cisco.com/docs/identity-services-engine/latest/#!read-a-resource/read-a-resource
             filters: \"filter=name.CONTAINS.voice\" returns all objects containing voice in the name.
         :sort: string (Optional) -> Sorting options for your results. Check documentation on how to properly sort.
-            sorting: \"sortasc=name\" this will sort on name ascending, A, B, C etc."""
-        if not api:
-            raise Exception("ISE_GET_api: You must provide the api/subtree to get data from, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        returnResults: list = []
-        page: int = 1
-        url: str = f"{self.__base_url}config/{api}?size={self.__maxresults}&page={page}"
-        if filter:
-            if not filter.startswith("filter="):
-                filter: str = f"filter={filter}"
-            url: str = f"{self.__base_url}config/{api}?{filter}&size={self.__maxresults}&page={page}"
-        if sort:
-            url: str = f"{url}&{sort}"
-        result: list = await self.__execute([["GET", url]])
-        if result and result[0]:
-            if "SearchResult" in result[0]:
-                total_entries: int = result[0]['SearchResult']['total']
-                for device in result[0]['SearchResult']['resources']:
-                    returnResults.append(device)
-                if total_entries > 100:
-                    parts: int = int(self.__returnNearestHundreds(total_entries)/100)
-                    MultiTask: list = []
-                    for _ in range(page, parts):
-                        page += 1
-                        url: str = url.replace(f"page={page-1}", f"page={page}")
-                        MultiTask.append(["GET", url])
-                    results: list = await self.__execute(MultiTask)
-                    if results and results[0]:
-                        for entries in results:
-                            for device in entries['SearchResult']['resources']:
-                                returnResults.append(device)
-            else:
-                returnResults.append(result[0])
-        return(returnResults)
+            sorting: \"sortasc=name\" this will sort on name ascending, A, B, C etc.
+        Raises ISERequestError if a page cannot be retrieved, instead of returning an incomplete list."""
+        return([entry async for entry in self.ISE_GET_api_stream(api, filter, sort)])
+
+    async def ISE_GET_api_stream(self, api: str, filter: str = "", sort: str = ""):
+        """Same as ISE_GET_api, but yields the objects as the pages arrive instead of returning them all in one list.
+        The pages are requested rate_limit pages at a time, so only one window of parsed pages is kept in memory. Pages with an ETag are also kept in the cache as raw response bodies, up to cache_size entries.
+        Example: async for device in ISE.ISE_GET_api_stream("networkdevice"): print(device)
+        :api: string (Required) -> The API config/* subtree you want to get data from
+        :filter: string (Optional) -> Same as the filter of ISE_GET_api
+        :sort: string (Optional) -> Same as the sort of ISE_GET_api
+        Raises ISERequestError if a page cannot be retrieved, the objects of the pages before it have been yielded by then."""
+        self.__require_api(api, "ISE_GET_api", "to get data from")
+        filter: str = self.__filter_qs(filter)
+        url: str = f"{self.__base_url}config/{api}?{filter}&" if filter else f"{self.__base_url}config/{api}?"
+        sorting: str = f"&{sort}" if sort else ""
+        page_url: str = f"{url}size={self.__maxresults}&page=" # Each page url is page_url, the page number and sorting.
+        first_url: str = f"{page_url}1{sorting}"
+        # The total of a recent call is reused, keyed under the first page url so writes to the subtree drop it together with the cached responses.
+        cached: tuple = self.__cache.get(f"{first_url}#total")
+        if cached and time() - cached[0] < self.__total_ttl:
+            total_entries, first_page = cached[1], 1
+        else:
+            # The first page is a full page and also tells the total number of objects, the remaining pages are requested together after it.
+            first: list = await self.__execute([["GET", first_url]])
+            if not first or not first[0]:
+                raise ISERequestError(f"ISE_GET_api: The first page of {api} could not be retrieved.")
+            if "SearchResult" not in first[0]:
+                yield(first[0])
+                return
+            for entry in first[0]['SearchResult']['resources']: yield(entry)
+            total_entries, first_page = first[0]['SearchResult']['total'], 2
+            if total_entries <= self.__maxresults: return # The first page already returned everything.
+            self.__cache[f"{first_url}#total"] = (time(), total_entries)
+        parts: int = self.__page_count(total_entries, self.__maxresults)
+        page_number: int = first_page
+        # Every page also tells the total. When objects were added after the total was found, for instance within the cache time, the pages they need are requested as well.
+        while page_number <= parts:
+            MultiTask = (("GET", f"{page_url}{page}{sorting}") for page in range(page_number, parts+1))
+            # Req sends rate_limit requests per second either way, so windows of rate_limit pages take as long as one batch.
+            async for results in self.__execute_chunked(MultiTask, self.__rate_limit):
+                for entries in results:
+                    if not entries:
+                        raise ISERequestError(f"ISE_GET_api: Page {page_number} of {parts} of {api} could not be retrieved, the result would be incomplete.")
+                    total_entries: int = max(total_entries, entries['SearchResult'].get('total', 0))
+                    for entry in entries['SearchResult']['resources']: yield(entry)
+                    page_number += 1
+            if self.__page_count(total_entries, self.__maxresults) > parts:
+                parts: int = self.__page_count(total_entries, self.__maxresults)
+                self.__cache[f"{first_url}#total"] = (time(), total_entries)
 
     async def ISE_POST_api(self, api: str, objects: list) -> bool:
         """Will create the objects that are in the objects list on the api subtree provided.
@@ -494,33 +547,30 @@ class NDCiscoISE():
             api examples: networkdevice, endpoint, networkdevicegroup etc.
         See more info: https://developer.cisco.com/docs/identity-services-engine/latest
             NOTE: Check the API documentation to find the correct payloads to send in order to create an object."""
-        if not api:
-            raise Exception("ISE_POST_api: You must provide the api/subtree to post data to, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        if not objects:
-            raise Exception("ISE_POST_api: You must provide a list of object payloads to be processed. Example: [{\"object1\":\"payload\"}, {\"object2\":\"payload\"}, etc.]")
-        if not isinstance(objects, list):
-            raise Exception("ISE_POST_api: Parameter objects must be a list of object payloads in json/dictionary format: [{\"object1\":\"payload\"}, {\"object2\":\"payload\"}, etc.]")
-        if not len(objects) > 0:
-            raise Exception("ISE_POST_api: Parameter objects cannot be empty, you must provide a list of object payloads to be processed. Example: [{\"object1\":\"payload\"}, {\"object2\":\"payload\"}, etc.]")
-        verification: bool = True
+        self.__require_api(api, "ISE_POST_api", "to post data to")
+        self.__require_list(objects, "ISE_POST_api", "objects", "object payloads to be processed")
         url: str = f"{self.__base_url}config/{api}"
-        MultiTask: list = [["POST", url, o] for o in objects]
-        results: list = await self.__execute(MultiTask)
-        for result in results:
-            if not result:
-                verification: bool = False
-                break
-        return(verification) # Returns True if all requests were successful, otherwise False.
+        MultiTask = (("POST", url, o) for o in objects)
+        # Created in list order, objects such as network device groups can refer to a parent earlier in the list.
+        async for results in self.__execute_chunked(MultiTask, ordered=True):
+            if not all(results): return(False)
+        return(True) # Returns True if all requests were successful, otherwise False.
 
     async def ISE_GET_versioninfo(self, api: str) -> dict:
-        """Returns current and supported API versions for the api subtree provided. 
+        """Returns current and supported API versions for the api subtree provided. The result is reused for 5 minutes per api subtree.
         :api: string (Required) -> The API config/* subtree you want to get versioninfo from.
             Examples: networkdevice, endpoint, networkdevicegroup etc."""
-        if not api:
-            raise Exception("ISE_GET_versioninfo: You must provide the api/subtree to get versioninfo from, example: networkdevice, endpoint, networkdevicegroup, etc.")
-        api: str = api.lower()
-        url: str = f"{self.__base_url}config/{api}/versioninfo"
-        result: list = await self.__execute([["GET", url]])
+        self.__require_api(api, "ISE_GET_versioninfo", "to get versioninfo from")
+        api: str = _norm_api(api)
+        key: str = f"versioninfo:{api}"
+        cached: tuple = self.__cache.get(key)
+        if cached and time() - cached[0] < self.__versioninfo_ttl: return(cached[1])
+        async with self.__versioninfo_locks.setdefault(api, Lock()):
+            cached: tuple = self.__cache.get(key)
+            if cached and time() - cached[0] < self.__versioninfo_ttl: return(cached[1])
+            url: str = f"{self.__base_url}config/{api}/versioninfo"
+            result: list = await self.__execute([["GET", url]])
+            self.__cache[key] = (time(), result[0]["VersionInfo"])
         return(result[0]["VersionInfo"]) # Example: {'currentServerVersion': '1.1', 'supportedVersions': '1.0,1.1', 'link': {'rel': 'self', 'href': 'https://172.18.66.41:9060/ers/config/networkdevice/versioninfo', 'type': 'application/json'}}
 
     async def ISE_PUT_bulk_submit(self, api: str, bulkpayload: str) -> str:
@@ -529,11 +579,10 @@ class NDCiscoISE():
         :api: string (Required) -> The API config/* subtree you want to submit bulk requests to.
             api examples: networkdevice, endpoint, etc.
         More info: https://developer.cisco.com/docs/identity-services-engine/latest/#!bulk-requests"""
-        if not api:
-            raise Exception("ISE_PUT_bulk_submit: You must provide the api/subtree to get versioninfo from, example: networkdevice, endpoint, networkdevicegroup, etc.")
+        self.__require_api(api, "ISE_PUT_bulk_submit", "to submit bulk requests to")
         if not bulkpayload:
-            raise Exception("ISE_PUT_bulk_submit: You must provide the bulkpayload to be processed.")
-        api: str = api.lower()
+            raise ISEArgumentError("ISE_PUT_bulk_submit: You must provide the bulkpayload to be processed.")
+        api: str = _norm_api(api)
         url: str = f"{self.__base_url}config/{api}/bulk/submit"
         result: list = await self.__execute([["PUT", url, bulkpayload]])
         return(result[0]) # Returns the bulkId after the request is submitted. Example: 1615791703003
@@ -544,11 +593,43 @@ class NDCiscoISE():
         :api: string (Required) -> The API config/* subtree you want to get bulk status from.
             api examples: networkdevice, endpoint, etc.
         More info: https://developer.cisco.com/docs/identity-services-engine/latest/#!bulk-requests"""
-        if not api:
-            raise Exception("ISE_GET_bulk_bulkid: You must provide the api/subtree to get versioninfo from, example: networkdevice, endpoint, networkdevicegroup, etc.")
+        self.__require_api(api, "ISE_GET_bulk_bulkid", "to get bulk status from")
         if not bulkId:
-            raise Exception("ISE_GET_bulk_bulkid: You must provide the bulkid in order to get bulk status.")
-        api: str = api.lower()
+            raise ISEArgumentError("ISE_GET_bulk_bulkid: You must provide the bulkid in order to get bulk status.")
+        api: str = _norm_api(api)
         url: str = f"{self.__base_url}config/{api}/bulk/{bulkId}"
         result: list = await self.__execute([["GET", url]])
         return(result[0]["BulkStatus"]) # Example: {"bulkId": 1615791703003, "mediaType": "", "executionStatus": "COMPLETED", "operationType": "create", "startTime": "Mon Mar 15 07:01:43 UTC 2021", "resourcesCount": 1, "successCount": 1, "failCount": 0, "resourcesStatus": [{ "id": "1234454324", "name": "resource1", "description": "description...", "resourceExecutionStatus": "COMPLETED", "status": "COMPLETED"}]}
+
+    async def ISE_GET_bulk_bulkids(self, api: str, bulkIds: list) -> dict:
+        """Returns the bulk status of every bulkId provided, checked simultaneously.
+        :bulkIds: list (Required) -> List of bulk request IDs to check status on, example: [\"1615791703003\", \"1615791703004\", etc.]
+        :api: string (Required) -> The API config/* subtree you want to get bulk status from.
+            api examples: networkdevice, endpoint, etc.
+        Returns a dictionary with the bulkId as key and the bulk status as value. The value is an empty dictionary if the status could not be retrieved."""
+        self.__require_api(api, "ISE_GET_bulk_bulkids", "to get bulk status from")
+        if not bulkIds or not isinstance(bulkIds, list):
+            raise ISEArgumentError("ISE_GET_bulk_bulkids: You must provide a list of bulkids in order to get bulk status.")
+        api: str = _norm_api(api)
+        url: str = f"{self.__base_url}config/{api}/bulk/"
+        results: list = await self.__execute([("GET", f"{url}{b}") for b in bulkIds])
+        return({b: r.get("BulkStatus", {}) if isinstance(r, dict) else {} for b, r in zip(bulkIds, results)})
+
+    async def ISE_GET_bulk_wait(self, api: str, bulkId: str, max_wait: int = 600) -> dict:
+        """Waits for a bulk request to complete and returns its last bulk status.
+        The status is checked with exponential backoff (1, 2, 4, ... up to 30 seconds between checks) until executionStatus is COMPLETED or max_wait seconds have passed.
+        :bulkId: string (Required) -> The ID of the bulk request to wait for.
+        :api: string (Required) -> The API config/* subtree the bulk request was submitted to.
+            api examples: networkdevice, endpoint, etc.
+        :max_wait: integer (Optional) -> Maximum number of seconds to wait. Default is 600 seconds"""
+        status: dict = {}
+        waited: int = 0
+        attempt: int = 0
+        while waited < max_wait:
+            status: dict = (await self.ISE_GET_bulk_bulkids(api, [bulkId]))[bulkId]
+            if status.get("executionStatus") == "COMPLETED": break
+            delay: int = min(2**attempt, 30)
+            await sleep(delay)
+            waited += delay
+            attempt += 1
+        return(status)
@@ -1,109 +1,282 @@
 # Developed by Rune Johannesen @2021-2023
-from aiohttp import ClientSession, BasicAuth, TCPConnector
-from asyncio import gather, sleep, create_task, Semaphore
+from aiohttp import ClientSession, ClientTimeout, ClientError, BasicAuth, TCPConnector
+from asyncio import gather, sleep, create_task, Condition, Task, CancelledError, TimeoutError as AsyncTimeoutError
+from time import monotonic
+from collections import OrderedDict
 from typing import Union
-from json import dumps
 from os.path import splitext, basename
 from General_logger import setup_logger
-from traceback import format_exc
+from random import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+try: from orjson import dumps as _dumps, loads as _loads
+except ImportError:
+    from json import dumps as _json_dumps, loads as _loads
+    def _dumps(payload: dict) -> bytes: return(_json_dumps(payload, separators=(',',':'), ensure_ascii=False).encode())
+
+
+_RETRY_STATUSES: frozenset = frozenset({408,429,500,502,503,504}) # Responses that are retried with backoff.
+_XML_HEADERS: dict = {'Content-Type': 'application/xml'} # Replaces the JSON Content-Type of the session for XML payloads, for instance bulk requests.
+_HTTP_ERR_MAP: dict = {400:'(400) Bad Request',401:'(401) Unauthorized',403:'(403) Forbidden',404:'(404) Not Found',405:'(405) Method Not Allowed',406:'(406) Not Acceptable',408:'(408) Request Timeout',409:'(409) Conflict',415:'(415) Unsupported Media Type',422:'(422) Unprocessable Entity',429:'(429) Too many requests',500:'(500) Internal Server Error',501:'(501) Not Implemented',502:'(502) Bad Gateway',503:'(503) Service Unavailable',504:'(504) Gateway Timeout'} # Log text for the error status codes Cisco ISE returns.
+
+
+def _is_xml(payload) -> bool:
+    """Returns True if payload is an XML string"""
+    return(isinstance(payload, str) and '<?xml version="1.0"' in payload)
+
+
+def _log_text(payload: Union[str,bytes]) -> str:
+    """Returns payload as text for the log, JSON payloads are serialized to bytes by check_payload"""
+    return(payload.decode("utf-8", "replace") if isinstance(payload, bytes) else payload)
+
+
+class TokenBucket():
+    """Rate limiter that lets a burst of up to rate requests through at once and refills at rate requests per second."""
+    def __init__(self, rate: int) -> None:
+        """:rate: integer (Required) Requests per second"""
+        self.__RATE: int = rate
+        self.__TOKENS: float = float(rate)
+        self.__LAST_REFILL: float = monotonic()
+
+    async def acquire(self) -> None:
+        """Takes a token for one request, waits until the token is due when the bucket is empty.
+        The bucket is updated before the first await, so concurrent callers each get their own slot without a lock"""
+        now: float = monotonic()
+        self.__TOKENS: float = min(self.__RATE, self.__TOKENS + (now - self.__LAST_REFILL) * self.__RATE) - 1
+        self.__LAST_REFILL: float = now
+        if self.__TOKENS < 0: await sleep(-self.__TOKENS / self.__RATE)
+
+
+class LRUCache(OrderedDict):
+    """Dictionary that holds up to maxsize entries. Adding an entry to a full cache drops the least recently used one."""
+    def __init__(self, maxsize: int = 256) -> None:
+        """:maxsize: integer (Optional) Maximum number of entries. Default is 256"""
+        super().__init__()
+        self.maxsize: int = maxsize
+
+    def get(self, key, default = None):
+        if key not in self: return(default)
+        self.move_to_end(key)
+        return(self[key])
+
+    def __setitem__(self, key, value) -> None:
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        if len(self) > self.maxsize: self.popitem(last=False)
+
+
+class AdmissionController():
+    """Limits the number of requests in flight. Unlike a Semaphore the limit can be changed while requests are waiting:
+    it is halved on (429) Too many requests and grows back by one after every limit successful requests, up to the starting limit."""
+    def __init__(self, limit: int) -> None:
+        """:limit: integer (Required) Maximum number of requests in flight"""
+        self.__MAX: int = limit
+        self.__LIMIT: int = limit
+        self.__ACTIVE: int = 0
+        self.__SUCCESSES: int = 0
+        self.__COND: Condition = Condition()
+
+    @property
+    def limit(self) -> int:
+        return(self.__LIMIT)
+
+    async def __aenter__(self) -> None:
+        async with self.__COND:
+            while self.__ACTIVE >= self.__LIMIT: await self.__COND.wait()
+            self.__ACTIVE += 1
+
+    async def __aexit__(self, *exc) -> None:
+        async with self.__COND:
+            self.__ACTIVE -= 1
+            self.__COND.notify(1)
+
+    async def set_limit(self, limit: int) -> None:
+        """Sets the limit, between 1 and the starting limit, and wakes the waiting requests that now fit"""
+        async with self.__COND:
+            self.__LIMIT: int = max(1, min(limit, self.__MAX))
+            self.__SUCCESSES: int = 0
+            self.__COND.notify_all()
+
+    async def backoff(self) -> None:
+        """Halves the limit"""
+        await self.set_limit(self.__LIMIT // 2)
+
+    async def success(self) -> None:
+        """Counts a successful request, raises the limit by one after limit of them in a row"""
+        if self.__LIMIT >= self.__MAX: return
+        self.__SUCCESSES += 1
+        if self.__SUCCESSES >= self.__LIMIT: await self.set_limit(self.__LIMIT + 1)
 
 
 class Req():
-    def __init__(self, headers: dict = None, timeout: int = None, rate_limit: int = 2, use_ssl: bool = True, auth: str = "") -> None:
+    def __init__(self, headers: dict = None, timeout: int = None, rate_limit: int = 2, use_ssl: bool = True, auth: str = "", etag_cache: dict = None, auth_header: str = None, keep_alive: bool = False, max_concurrent: int = 10, max_retries: int = 5, bucket: "TokenBucket" = None, pool_limit: int = None, per_host_limit: int = 0) -> None:
         """
         :headers: dict (Optional) Specify a custom header to use with your request. Default is {'Content-Type':'application/json','Accept':'application/json','cache-control':'no-cache'}
         :timeout: integer (Optional) Set a timeout for your request. Default is 60 seconds
-        :rate_limit: integer (Optional) Change the rate limit to make the requests faster. Default is 2 requests per second
+        :rate_limit: integer (Optional) Change the rate limit to make the requests faster. Default is 2 requests per second. Requests are paced with a token bucket that holds up to rate_limit requests
         :use_ssl: boolean (Optional) Set to False if server certificate is not verifiable
-        :auth: string (Optional) If your request needs Basic Authentication, enter username and password with space comma space separator, example: auth=\"username , password\""""
-        self.__HTTP_ERR_MAP: dict = {400:'(400) Bad Request',401:'(401) Unauthorized',403:'(403) Forbidden',404:'(404) Not Found',405:'(405) Method Not Allowed',406:'(406) Not Acceptable',409:'(409) Conflict',415:'(415) Unsupported Media Type',422:'(422) Unprocessable Entity',429:'(429) Too many requests',500:'(500) Internal Server Error',501:'(501) Not Implemented',503:'(503) Service Unavailable'}
+        :auth: string (Optional) If your request needs Basic Authentication, enter username and password with space comma space separator, example: auth=\"username , password\"
+        :etag_cache: dict (Optional) Cache for GET responses keyed by url. Responses with an ETag header are stored as (etag, response body) and sent with If-None-Match next time. A 304 Not Modified response parses the cached body again, so every caller gets its own copy. The cache is not bounded by Req, use for instance an LRUCache
+        :auth_header: string (Optional) Precomputed Authorization header value, example: auth_header=\"Basic dXNlcm5hbWU6cGFzc3dvcmQ=\". Takes the place of auth, so the credentials are not encoded again for every request
+        :keep_alive: boolean (Optional) Keep the connection pool open between make_requests calls, so open TLS connections are reused by the next call. You must call close() when done. Default is False
+        :max_concurrent: integer (Optional) Maximum number of requests in flight at the same time, and the size of the connection pool. Default is 10
+        :max_retries: integer (Optional) Times a request is retried on (408), (429) Too many requests, (500), (502), (503) and (504) responses. Waits the Retry-After header (seconds or HTTP date) if there is one, otherwise 1, 2, 4, 8, 8... seconds plus up to 0.25 seconds of jitter. Default is 5
+        :bucket: TokenBucket (Optional) Share one rate limit between several Req instances. Default is a new TokenBucket(rate_limit)
+        :pool_limit: integer (Optional) Maximum number of open connections in the pool. Default is max_concurrent, more than that can never be in use at the same time
+        :per_host_limit: integer (Optional) Maximum number of open connections to one host. Default is 0 (no limit other than pool_limit)"""
         self.__HEADERS: dict = headers if headers else {'Content-Type': 'application/json', 'Accept': 'application/json', 'cache-control': 'no-cache'}
         self.__TIMEOUT: int = timeout if timeout else 60
-        self.__RATE_LIMIT: int = rate_limit
-        self.__USE_SSL: bool = TCPConnector(verify_ssl=True) if use_ssl else TCPConnector(verify_ssl=False)
+        self.__REQUEST_TIMEOUT: ClientTimeout = ClientTimeout(total=self.__TIMEOUT, sock_connect=min(10, self.__TIMEOUT)) # Built once, used by every request.
+        self.__BUCKET: TokenBucket = bucket if bucket else TokenBucket(rate_limit)
+        self.__MAX_CONCURRENT: int = max_concurrent
+        self.__ADMISSION: AdmissionController = AdmissionController(max_concurrent)
+        self.__MAX_RETRIES: int = max_retries
+        self.__POOL_LIMIT: int = pool_limit if pool_limit else max_concurrent
+        self.__PER_HOST_LIMIT: int = per_host_limit
+        self.__USE_SSL: bool = use_ssl
+        self.__KEEP_ALIVE: bool = keep_alive
+        self.__SESSION: ClientSession = None # Created by the first make_requests call.
         self.__AUTH: str = None
+        self.__ETAG_CACHE: dict = etag_cache
         self.__LOGGER = setup_logger(splitext(basename(__file__))[0])
-        if auth:
+        if auth_header: self.__HEADERS: dict = {**self.__HEADERS, 'Authorization': auth_header}
+        elif auth:
             try:
                 usernm,passwd = auth.split(" , ")
                 self.__AUTH: str = BasicAuth(usernm,passwd)
             except: raise Exception("There was a problem with auth. You must separate the username and password with \" , \" (space comma space)")
 
-    def returnPartionedList(self, inputlist: list) -> list:
-        """Returns a list split into segments of self.RATE_LIMIT
-        :inputlist: list (Required) List of lists containing data to split into segments. Example: [[data],[data],[data],etc...]"""
-        return([inputlist[i:i + self.__RATE_LIMIT] for i in range(0, len(inputlist), self.__RATE_LIMIT)])
+    @staticmethod
+    def __retry_after(value: str) -> Union[float,None]:
+        """Private method\n
+        Returns the seconds to wait from a Retry-After header, given either as seconds or as an HTTP date. None if there is no usable value"""
+        if value.isdigit(): return(float(value))
+        try: return(max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()))
+        except (TypeError, ValueError): return(None)
+
+    @staticmethod
+    def __parse(body: bytes, charset: str = None) -> Union[dict,str]:
+        """Private method\n
+        Returns the response body parsed as JSON, or as text if it is not JSON"""
+        if not body: return("")
+        try: return(_loads(body))
+        except ValueError: return(body.decode(charset or "utf-8", errors="replace"))
 
-    async def __req(self, url: str, session: ClientSession, method: str, payload: str, semaphore: Semaphore, validate: bool = False) -> Union[dict,str]:
+    async def __req(self, url: str, session: ClientSession, method: str, payload: str, attempt: int = 0) -> Union[dict,str]:
         """Private method\n
         Returns the request as either a dict or string. Dictionary will always be the preferred return type
         :url: string (Required) Url to request or post data to/from
         :method: string (Required) Supported request methods: get, post, put, delete and patch
         :payload: string (Required) Request payload. Leave blank ('') for no payload
-        :validate: boolean (Optional) Method to retry a request that fails. Default is False\n
-        If response status is (500) Internal Server Error, the request will be retried after 10 seconds"""
+        :attempt: integer (Optional) Number of times the request has been retried. Default is 0\n
+        If response status is (408), (429), (500), (502), (503) or (504), the request is retried up to max_retries times with exponential backoff"""
+        use_cache: bool = self.__ETAG_CACHE is not None and method.upper() == "GET"
+        cached: tuple = self.__ETAG_CACHE.get(url) if use_cache else None
+        retry_delay: float = None
+        headers: dict = {"If-None-Match": cached[0]} if cached else None
+        if _is_xml(payload): headers: dict = _XML_HEADERS
         try:
-            async with semaphore:
-                async with session.request(method=method, url=url, data=payload, timeout=self.__TIMEOUT) as response:
-                    if response.status in range(200,299):
-                        if response.status == 202:
-                            try: return(str(response.headers['location'].split("submit/",1)[1]))
-                            except: pass
-                        try: r: dict = await response.json()
-                        except: r: str = await response.text()
+            async with self.__ADMISSION:
+                # The token is taken once a slot is free, so requests that waited for a slot do not all go out together.
+                await self.__BUCKET.acquire()
+                async with session.request(method=method, url=url, data=payload, headers=headers, timeout=self.__REQUEST_TIMEOUT) as response:
+                    status: int = response.status
+                    if status == 304 and cached:
+                        return(self.__parse(cached[1]))
+                    if 200 <= status < 300:
+                        await self.__ADMISSION.success()
+                        if status == 202:
+                            bulkId: str = response.headers.get('location', "").partition("submit/")[2] # Bulk submit responses point to .../bulk/submit/<bulkId>
+                            if bulkId: return(bulkId)
+                        body: bytes = await response.read() if status != 204 else b"" # 204 No Content has no body to read.
+                        r: Union[dict,str] = self.__parse(body, response.charset)
                         if not r: r: dict = {"OK":f"{method}","HEADERS":response.headers}
+                        elif use_cache and "ETag" in response.headers: self.__ETAG_CACHE[url] = (response.headers["ETag"], body) # The body is kept, not r, which the caller is free to change.
                         return(r)
-                    elif response.status == 500:
-                        if not validate:
-                            await sleep(10)
-                            return(await self.__req(url,session,method,payload,semaphore,validate=True))
-                        if payload: self.__LOGGER.info(f"Server Error: {response.status} -> Operation: {method} -> URL: {url} -> Payload:\n{payload}")
-                        else: self.__LOGGER.info(f"Server Error: {response.status} -> Operation: {method} -> URL: {url}")
+                    elif status in _RETRY_STATUSES and attempt < self.__MAX_RETRIES:
+                        if status == 429: await self.__ADMISSION.backoff()
+                        retry_delay: float = self.__retry_after(response.headers.get("Retry-After", ""))
+                        if retry_delay is None: retry_delay: float = min(2**attempt, 8) + random()/4
+                    elif status >= 500:
+                        if payload: self.__LOGGER.info("Server Error: %s -> Operation: %s -> URL: %s -> Payload:\n%s", status, method, url, _log_text(payload))
+                        else: self.__LOGGER.info("Server Error: %s -> Operation: %s -> URL: %s", status, method, url)
                     else:
-                        try: r: dict = await response.json()
-                        except: r: str = await response.text()
+                        r: Union[dict,str] = self.__parse(await response.read(), response.charset)
                         if not r: r: str = "N/A"
-                        if payload: self.__LOGGER.info(f"Client Error: {self.__HTTP_ERR_MAP[response.status]} -> Operation: {method} -> URL: {url}\nPayload:\n{payload}\nResponse:\n{r}\n")
-                        else: self.__LOGGER.info(f"Client Error: {self.__HTTP_ERR_MAP[response.status]} -> Operation: {method} -> URL: {url}\nResponse:\n{r}\n")
+                        error: str = _HTTP_ERR_MAP.get(status) or f"({status}) Unknown"
+                        if payload: self.__LOGGER.info("Client Error: %s -> Operation: %s -> URL: %s\nPayload:\n%s\nResponse:\n%s\n", error, method, url, _log_text(payload), r)
+                        else: self.__LOGGER.info("Client Error: %s -> Operation: %s -> URL: %s\nResponse:\n%s\n", error, method, url, r)
+        except (ClientError, AsyncTimeoutError) as error:
+            # Connection problems and timeouts are expected now and then, they are logged without a traceback.
+            self.__LOGGER.info("Network Error: %r -> Operation: %s -> URL: %s", error, method, url)
+        except CancelledError: raise # Subclasses Exception before Python 3.8, cancellation must not be logged and swallowed below.
         except Exception:
-            if payload: self.__LOGGER.info(f"Exception Error -> Operation: {method} -> URL: {url}\nPayload:\n{payload}\n{format_exc()}")
-            else: self.__LOGGER.info(f"Exception Error -> Operation: {method} -> URL: {url}\n{format_exc()}")
+            # exc_info leaves the traceback to logging, it is only rendered when the info level is enabled.
+            if payload: self.__LOGGER.info("Exception Error -> Operation: %s -> URL: %s\nPayload:\n%s", method, url, _log_text(payload), exc_info=True)
+            else: self.__LOGGER.info("Exception Error -> Operation: %s -> URL: %s", method, url, exc_info=True)
+        if retry_delay is not None:
+            # Waits outside the admission limit, so other requests can use the connection meanwhile.
+            await sleep(retry_delay)
+            return(await self.__req(url,session,method,payload,attempt+1))
         return({})
 
-    async def make_requests(self, req_list: list) -> list:
+    async def make_requests(self, req_list: list, ordered: bool = False) -> list:
         """Returns the results from the requests in req_list in a list of lists format, example: [[response],[response],etc...]
         :req_list: list (Required) List of lists with requests to be processed
             Structure: [[method: str (Required), url: str (Required), payload: dict (Optional)],[...]]
             Allowed methods: get, post, put, delete and patch
-            Payload must be a dictionary, it will be converted to a string
+            Payload must be a dictionary, it will be converted to a string. Payloads that are already serialized to bytes are sent as is
         req_list Examples:
             [
                 ["GET","www.example.com"],\n
                 ["POST","www.example.com",{"some":"payload"}],\n
                 ["PUT","www.example.com",{"some":"payload"}]
-            ]"""
-        def check_payload(entry: list) -> Union[str,None]:
-            try:
-                if '<?xml version="1.0"' in entry[2]:
-                    return(entry[2])
-                else: return(dumps(entry[2]))
-            except: return(None)
+            ]
+        :ordered: boolean (Optional) Send requests that are not GET one at a time in list order, for instance when an object must exist before the next one can refer to it. Default is False, all requests run concurrently"""
+        def check_payload(entry: list) -> Union[str,bytes,None]:
+            """Returns the body of entry once, ready to send: None without a payload, bytes and XML strings as they are, anything else serialized to JSON bytes"""
+            if len(entry) < 3 or entry[2] is None: return(None)
+            payload: Union[dict,str,bytes] = entry[2]
+            if isinstance(payload, bytes) or _is_xml(payload): return(payload)
+            return(_dumps(payload))
         if not req_list or not req_list[0]:
             raise Exception("req_list cannot be empty, you must provide requests to be processed.\n\nThe format is (list of lists):\n    [[method: str (Required), url: str (Required), payload: dict (Optional)],[...]]")
         resultsList: list = []
-        partitions: list = self.returnPartionedList(req_list)
-        semaphore: Semaphore = Semaphore(10)
-        async with ClientSession(auth=self.__AUTH, headers=self.__HEADERS, connector=self.__USE_SSL, timeout=self.__TIMEOUT*2) as session:
-            for partition in partitions:
-                partitionTasks: list = []
-                for entry in partition:
-                    if "get" in entry[0].lower():
-                        partitionTasks.append(create_task(self.__req(entry[1],session,entry[0],check_payload(entry),semaphore)))
-                    else:
-                        result: Union[str,dict] = await self.__req(entry[1],session,entry[0],check_payload(entry),semaphore)
-                        resultsList.append(result)
-                if partitionTasks:
-                    results: list = await gather(*partitionTasks)
-                    for result in results: resultsList.append(result)
-                await sleep(1.1)
+        session: ClientSession = self.__session()
+        try:
+            # Every request runs concurrently, the token bucket sets the pace and the admission controller the concurrency.
+            if not ordered:
+                resultsList: list = await gather(*[self.__req(entry[1],session,entry[0],check_payload(entry)) for entry in req_list])
+            else:
+                # Requests that are not GET are awaited one at a time as they come, GET requests run as tasks meanwhile.
+                for entry in req_list:
+                    if "get" not in entry[0].lower(): resultsList.append(await self.__req(entry[1],session,entry[0],check_payload(entry)))
+                    else: resultsList.append(create_task(self.__req(entry[1],session,entry[0],check_payload(entry))))
+                tasks: list = [r for r in resultsList if isinstance(r, Task)]
+                if tasks: await gather(*tasks)
+                resultsList: list = [r.result() if isinstance(r, Task) else r for r in resultsList]
+        finally:
+            if not self.__KEEP_ALIVE: await self.close()
         return(resultsList)
+
+    def __session(self) -> ClientSession:
+        """Private method\n
+        Returns the open session, creates it and its connection pool if there is none"""
+        if self.__SESSION is None or self.__SESSION.closed:
+            connector: TCPConnector = TCPConnector(ssl=None if self.__USE_SSL else False, limit=self.__POOL_LIMIT, limit_per_host=self.__PER_HOST_LIMIT, ttl_dns_cache=300, keepalive_timeout=75)
+            self.__SESSION: ClientSession = ClientSession(auth=self.__AUTH, headers=self.__HEADERS, connector=connector, timeout=ClientTimeout(total=self.__TIMEOUT*2))
+        return(self.__SESSION)
+
+    async def close(self) -> None:
+        """Closes the session and its connection pool. Only needed when keep_alive is True"""
+        if self.__SESSION is not None:
+            await self.__SESSION.close()
+            self.__SESSION: ClientSession = None
+
+    async def __aenter__(self):
+        """Keeps the session open until the async with block ends, same as keep_alive=True"""
+        self.__KEEP_ALIVE: bool = True
+        return(self)
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()